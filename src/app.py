@@ -5,125 +5,277 @@ A super simple FastAPI application that allows students to view and sign up
 for extracurricular activities at Mergington High School.
 """
 
-from fastapi import FastAPI, HTTPException
+from collections import defaultdict
+from typing import Annotated
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-import os
+from fastapi.responses import RedirectResponse, Response
+import msgspec
 from pathlib import Path
+import sys
+import time
 
 app = FastAPI(title="Mergington High School API",
               description="API for viewing and signing up for extracurricular activities")
 
 # Mount the static files directory
-current_dir = Path(__file__).parent
-app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent,
-          "static")), name="static")
-
-# In-memory activity database
-activities = {
-    "Chess Club": {
-        "description": "Learn strategies and compete in chess tournaments",
-        "schedule": "Fridays, 3:30 PM - 5:00 PM",
-        "max_participants": 12,
-        "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
-    },
-    "Programming Class": {
-        "description": "Learn programming fundamentals and build software projects",
-        "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-        "max_participants": 20,
-        "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
-    },
-    "Gym Class": {
-        "description": "Physical education and sports activities",
-        "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-        "max_participants": 30,
-        "participants": ["john@mergington.edu", "olivia@mergington.edu"]
-    },
+STATIC_DIR = str((Path(__file__).parent / "static").resolve())
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+
+
+class Activity(msgspec.Struct):
+    """An extracurricular activity and the emails of the students signed up for it"""
+    description: str
+    schedule: str
+    max_participants: int
+    participants: set[str]
+
+
+# Initial activity data; the live copy is kept in memory by the ActivityStore below.
+# State lives in this process only, so the app must run as a single worker; handlers
+# never await between a check and its mutation, which keeps signup/unregister atomic
+# on the event loop.
+activities: dict[str, Activity] = {
+    "Chess Club": Activity(
+        description="Learn strategies and compete in chess tournaments",
+        schedule="Fridays, 3:30 PM - 5:00 PM",
+        max_participants=12,
+        participants={"michael@mergington.edu", "daniel@mergington.edu"}
+    ),
+    "Programming Class": Activity(
+        description="Learn programming fundamentals and build software projects",
+        schedule="Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
+        max_participants=20,
+        participants={"emma@mergington.edu", "sophia@mergington.edu"}
+    ),
+    "Gym Class": Activity(
+        description="Physical education and sports activities",
+        schedule="Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
+        max_participants=30,
+        participants={"john@mergington.edu", "olivia@mergington.edu"}
+    ),
     # Sports activities
-    "Soccer Team": {
-        "description": "Join the school soccer team for practices and matches",
-        "schedule": "Tuesdays and Thursdays, 4:00 PM - 6:00 PM",
-        "max_participants": 22,
-        "participants": ["alex@mergington.edu", "lisa@mergington.edu"]
-    },
-    "Basketball Club": {
-        "description": "Practice skills and play friendly games",
-        "schedule": "Wednesdays and Saturdays, 4:00 PM - 6:00 PM",
-        "max_participants": 15,
-        "participants": ["mike@mergington.edu", "nina@mergington.edu"]
-    },
+    "Soccer Team": Activity(
+        description="Join the school soccer team for practices and matches",
+        schedule="Tuesdays and Thursdays, 4:00 PM - 6:00 PM",
+        max_participants=22,
+        participants={"alex@mergington.edu", "lisa@mergington.edu"}
+    ),
+    "Basketball Club": Activity(
+        description="Practice skills and play friendly games",
+        schedule="Wednesdays and Saturdays, 4:00 PM - 6:00 PM",
+        max_participants=15,
+        participants={"mike@mergington.edu", "nina@mergington.edu"}
+    ),
     # Artistic activities
-    "Art Club": {
-        "description": "Explore drawing, painting, and mixed media projects",
-        "schedule": "Mondays, 3:30 PM - 5:30 PM",
-        "max_participants": 18,
-        "participants": ["lucas@mergington.edu", "mia@mergington.edu"]
-    },
-    "Drama Club": {
-        "description": "Acting workshops and stage productions",
-        "schedule": "Wednesdays, 4:00 PM - 6:00 PM",
-        "max_participants": 25,
-        "participants": ["ashley@mergington.edu", "ben@mergington.edu"]
-    },
+    "Art Club": Activity(
+        description="Explore drawing, painting, and mixed media projects",
+        schedule="Mondays, 3:30 PM - 5:30 PM",
+        max_participants=18,
+        participants={"lucas@mergington.edu", "mia@mergington.edu"}
+    ),
+    "Drama Club": Activity(
+        description="Acting workshops and stage productions",
+        schedule="Wednesdays, 4:00 PM - 6:00 PM",
+        max_participants=25,
+        participants={"ashley@mergington.edu", "ben@mergington.edu"}
+    ),
     # Intellectual activities
-    "Debate Team": {
-        "description": "Learn argumentation, public speaking, and competitive debating",
-        "schedule": "Tuesdays, 5:00 PM - 7:00 PM",
-        "max_participants": 20,
-        "participants": ["chris@mergington.edu", "taylor@mergington.edu"]
-    },
-    "Science Olympiad": {
-        "description": "Prepare for science competitions across multiple disciplines",
-        "schedule": "Fridays, 4:00 PM - 6:00 PM",
-        "max_participants": 16,
-        "participants": ["oliver@mergington.edu", "sara@mergington.edu"]
-    }
+    "Debate Team": Activity(
+        description="Learn argumentation, public speaking, and competitive debating",
+        schedule="Tuesdays, 5:00 PM - 7:00 PM",
+        max_participants=20,
+        participants={"chris@mergington.edu", "taylor@mergington.edu"}
+    ),
+    "Science Olympiad": Activity(
+        description="Prepare for science competitions across multiple disciplines",
+        schedule="Fridays, 4:00 PM - 6:00 PM",
+        max_participants=16,
+        participants={"oliver@mergington.edu", "sara@mergington.edu"}
+    )
 }
 
+# Student email query parameter; the pattern is compiled once at route registration and
+# accepts the same addresses as the form's <input type="email"> (e.g. student@localhost)
+EmailParam = Annotated[str, Query(pattern=r"^[^@\s]+@[^@\s]+$", max_length=254)]
+
+
+class ActivityStore:
+    """Activities database together with the lookup and serialization state derived from it"""
+
+    def __init__(self, activities: dict[str, Activity]) -> None:
+        # Work on interned copies so the caller's data is never mutated; repeated names and
+        # emails then share one object and compare by identity
+        self.activities: dict[str, Activity] = {
+            sys.intern(name): msgspec.structs.replace(
+                details, participants={sys.intern(email) for email in details.participants}
+            )
+            for name, details in activities.items()
+        }
+        # Reverse index of student email -> names of the activities they are signed up for
+        self.participant_index: dict[str, set[str]] = defaultdict(set)
+        # Serialized static fields of each activity, ending just before its participants list
+        self._meta_bytes: dict[str, bytes] = {}
+        for name, details in self.activities.items():
+            for email in details.participants:
+                self.participant_index[email].add(name)
+            meta = msgspec.structs.asdict(details)
+            del meta["participants"]
+            # Drop the closing brace so the participants list can be appended on each rebuild
+            self._meta_bytes[name] = (
+                msgspec.json.encode(name) + b":" + msgspec.json.encode(meta)[:-1]
+                + b',"participants":'
+            )
+        # Serialized /activities payload, rebuilt lazily after each mutation
+        self._payload: bytes | None = None
+        # Bumped on every mutation; exposed to clients as the /activities ETag. Seeded from
+        # the clock so ETags issued before a restart never match the reset in-memory data.
+        self.version: int = time.time_ns()
+
+    def invalidate(self) -> None:
+        """Drop the cached /activities payload so the next read re-serializes it"""
+        self._payload = None
+        self.version += 1
+
+    def payload(self) -> bytes:
+        """Return the serialized activities, rebuilding it if a mutation invalidated it"""
+        if self._payload is None:
+            # Only the participants change at runtime; stitch them onto the pre-serialized
+            # metadata. They are stored as sets for O(1) lookups, so emit sorted lists.
+            self._payload = b"{" + b",".join(
+                self._meta_bytes[name]
+                + msgspec.json.encode(sorted(details.participants)) + b"}"
+                for name, details in self.activities.items()
+            ) + b"}"
+        return self._payload
+
+
+_store = ActivityStore(activities)
+
+
+async def get_activities_store() -> ActivityStore:
+    """Dependency providing the application's activity store, resolved on the event loop"""
+    return _store
+
+
+StoreParam = Annotated[ActivityStore, Depends(get_activities_store)]
+
+
+# JSON fragments for the signup/unregister confirmation messages
+_SIGNUP_PREFIX = b'{"message":"Signed up '
+_SIGNUP_MID = b' for '
+_UNREGISTER_PREFIX = b'{"message":"Unregistered '
+_UNREGISTER_MID = b' from '
+_MESSAGE_SUFFIX = b'"}'
+
+
+def _json_fragment(value: str) -> bytes:
+    """Encode a string as escaped JSON string contents, without the surrounding quotes"""
+    return msgspec.json.encode(value)[1:-1]
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weakly compare an If-None-Match header (a list of tags or "*") with an ETag"""
+    if if_none_match is None:
+        return False
+    opaque_tag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque_tag:
+            return True
+    return False
+
+
+# The landing redirect never changes, so build it once and reuse it; 308 lets browsers cache it
+_ROOT_REDIRECT = RedirectResponse(url="/static/index.html", status_code=308)
+
 
 @app.get("/")
-def root():
-    return RedirectResponse(url="/static/index.html")
+async def root() -> RedirectResponse:
+    return _ROOT_REDIRECT
 
 
 @app.get("/activities")
-def get_activities():
-    return activities
+async def get_activities(request: Request, store: StoreParam) -> Response:
+    etag = f'W/"{store.version}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(store.payload(), media_type="application/json",
+                    headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
 @app.post("/activities/{activity_name}/signup")
-def signup_for_activity(activity_name: str, email: str):
+async def signup_for_activity(activity_name: str, email: EmailParam,
+                              store: StoreParam) -> Response:
     """Sign up a student for an activity"""
     # Validate activity exists
-    if activity_name not in activities:
+    if activity_name not in store.activities:
         raise HTTPException(status_code=404, detail="Activity not found")
 
+    # Use the interned key so later lookups compare by identity; it already exists,
+    # so this never interns a new string
+    activity_name = sys.intern(activity_name)
+
     # Get the specific activity
-    activity = activities[activity_name]
+    activity = store.activities[activity_name]
 
     # Validate student is not already signed up
-    if email in activity["participants"]:
+    if activity_name in store.participant_index.get(email, ()):
         raise HTTPException(status_code=400, detail="Student is already signed up")
 
-    # Add student
-    activity["participants"].append(email)
-    return {"message": f"Signed up {email} for {activity_name}"}
+    # Validate activity has room left
+    if len(activity.participants) >= activity.max_participants:
+        raise HTTPException(status_code=409, detail="Activity is full")
+
+    # Add student, interning the email only now that it is being stored
+    email = sys.intern(email)
+    activity.participants.add(email)
+    store.participant_index[email].add(activity_name)
+    store.invalidate()
+    return Response(
+        _SIGNUP_PREFIX + _json_fragment(email) + _SIGNUP_MID
+        + _json_fragment(activity_name) + _MESSAGE_SUFFIX,
+        media_type="application/json",
+    )
 
 
 @app.delete("/activities/{activity_name}/unregister")
-def unregister_from_activity(activity_name: str, email: str):
+async def unregister_from_activity(activity_name: str, email: EmailParam,
+                                   store: StoreParam) -> Response:
     """Unregister a student from an activity"""
     # Validate activity exists
-    if activity_name not in activities:
+    if activity_name not in store.activities:
         raise HTTPException(status_code=404, detail="Activity not found")
 
+    # Use the interned key so later lookups compare by identity; it already exists,
+    # so this never interns a new string
+    activity_name = sys.intern(activity_name)
+
     # Get the specific activity
-    activity = activities[activity_name]
+    activity = store.activities[activity_name]
 
     # Validate student is currently signed up
-    if email not in activity["participants"]:
+    if email not in activity.participants:
         raise HTTPException(status_code=400, detail="Student is not signed up for this activity")
 
     # Remove student
-    activity["participants"].remove(email)
-    return {"message": f"Unregistered {email} from {activity_name}"}
+    activity.participants.discard(email)
+    store.participant_index[email].discard(activity_name)
+    if not store.participant_index[email]:
+        del store.participant_index[email]
+    store.invalidate()
+    return Response(
+        _UNREGISTER_PREFIX + _json_fragment(email) + _UNREGISTER_MID
+        + _json_fragment(activity_name) + _MESSAGE_SUFFIX,
+        media_type="application/json",
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # uvloop is not available on Windows; access logging is off for throughput
+    uvicorn.run(app, host="0.0.0.0", port=8000,
+                loop="asyncio" if sys.platform == "win32" else "uvloop", http="httptools",
+                access_log=False, log_level="warning")
@@ -6,40 +6,30 @@ import os
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from app import app
+from app import ActivityStore, app, get_activities_store
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def client():
-    """Create a test client for the FastAPI app"""
-    return TestClient(app)
+    """Create a test client for the FastAPI app, shared across a test module"""
+    with TestClient(app) as c:
+        yield c
 
-@pytest.fixture
-def sample_activities():
-    """Fixture to reset activities to a known state for testing"""
-    from app import activities
+@pytest.fixture(autouse=True)
+def store(request):
+    """Serve the test class's ACTIVITIES from an isolated store for each test"""
+    activities = getattr(request.cls, "ACTIVITIES", None)
+    if activities is None:
+        yield None
+        return
     
-    # Store original activities
-    original_activities = activities.copy()
+    store = ActivityStore(activities)
     
-    # Reset to a known test state
-    activities.clear()
-    activities.update({
-        "Test Activity": {
-            "description": "A test activity",
-            "schedule": "Test schedule",
-            "max_participants": 2,
-            "participants": ["test1@mergington.edu"]
-        },
-        "Empty Activity": {
-            "description": "An empty test activity",
-            "schedule": "Test schedule",
-            "max_participants": 1,
-            "participants": []
-        }
-    })
+    # Async like the real dependency, so requests never hop to the threadpool
+    async def override():
+        return store
     
-    yield activities
+    app.dependency_overrides[get_activities_store] = override
     
-    # Restore original activities after test
-    activities.clear()
-    activities.update(original_activities)
\ No newline at end of file
+    yield store
+    
+    app.dependency_overrides.pop(get_activities_store, None)
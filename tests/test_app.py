@@ -1,27 +1,35 @@
+import asyncio
+import httpx
 import pytest
-from fastapi.testclient import TestClient
 import sys
 import os
 
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from app import app
+from app import Activity, ActivityStore, app
 
 
 class TestApp:
     """Test suite for basic app functionality"""
     
-    def test_root_redirect(self):
+    ACTIVITIES = {
+        "Chess Club": Activity(
+            description="Learn strategies and compete in chess tournaments",
+            schedule="Fridays, 3:30 PM - 5:00 PM",
+            max_participants=12,
+            participants={"michael@mergington.edu", "daniel@mergington.edu"}
+        )
+    }
+    
+    def test_root_redirect(self, client):
         """Test that root path redirects to static/index.html"""
-        client = TestClient(app)
         response = client.get("/", follow_redirects=False)
-        assert response.status_code == 307
+        assert response.status_code == 308
         assert response.headers["location"] == "/static/index.html"
     
-    def test_get_activities(self):
+    def test_get_activities(self, client):
         """Test getting all activities"""
-        client = TestClient(app)
         response = client.get("/activities")
         assert response.status_code == 200
         
@@ -39,34 +47,50 @@ class TestApp:
             assert "participants" in activity_data
             assert isinstance(activity_data["participants"], list)
             assert isinstance(activity_data["max_participants"], int)
+    
+    def test_get_activities_not_modified(self, client):
+        """Test that a matching ETag yields 304 Not Modified"""
+        response = client.get("/activities")
+        etag = response.headers["etag"]
+        
+        response = client.get("/activities", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+    
+    def test_get_activities_not_modified_weak_comparison(self, client):
+        """Test that If-None-Match lists, strong tags and * are weakly compared"""
+        etag = client.get("/activities").headers["etag"]
+        opaque_tag = etag.removeprefix("W/")
+        
+        for header in (f'W/"stale", {etag}', opaque_tag, "*"):
+            response = client.get("/activities", headers={"If-None-Match": header})
+            assert response.status_code == 304, header
+        
+        response = client.get("/activities", headers={"If-None-Match": 'W/"stale", "other"'})
+        assert response.status_code == 200
 
 
 class TestActivitySignup:
     """Test suite for activity signup functionality"""
     
-    def setup_method(self):
-        """Reset activities before each test"""
-        from app import activities
-        activities.clear()
-        activities.update({
-            "Test Activity": {
-                "description": "A test activity",
-                "schedule": "Test schedule",
-                "max_participants": 2,
-                "participants": ["existing@mergington.edu"]
-            },
-            "Full Activity": {
-                "description": "A full test activity",
-                "schedule": "Test schedule",
-                "max_participants": 1,
-                "participants": ["full@mergington.edu"]
-            }
-        })
-        self.client = TestClient(app)
-    
-    def test_signup_success(self):
+    ACTIVITIES = {
+        "Test Activity": Activity(
+            description="A test activity",
+            schedule="Test schedule",
+            max_participants=2,
+            participants={"existing@mergington.edu"}
+        ),
+        "Full Activity": Activity(
+            description="A full test activity",
+            schedule="Test schedule",
+            max_participants=1,
+            participants={"full@mergington.edu"}
+        )
+    }
+    
+    def test_signup_success(self, client):
         """Test successful signup for an activity"""
-        response = self.client.post(
+        response = client.post(
             "/activities/Test Activity/signup?email=newstudent@mergington.edu"
         )
         assert response.status_code == 200
@@ -77,13 +101,13 @@ class TestActivitySignup:
         assert "Test Activity" in data["message"]
         
         # Verify the participant was added
-        activities_response = self.client.get("/activities")
+        activities_response = client.get("/activities")
         activities_data = activities_response.json()
         assert "newstudent@mergington.edu" in activities_data["Test Activity"]["participants"]
     
-    def test_signup_nonexistent_activity(self):
+    def test_signup_nonexistent_activity(self, client):
         """Test signup for a non-existent activity"""
-        response = self.client.post(
+        response = client.post(
             "/activities/Nonexistent Activity/signup?email=student@mergington.edu"
         )
         assert response.status_code == 404
@@ -91,9 +115,9 @@ class TestActivitySignup:
         data = response.json()
         assert data["detail"] == "Activity not found"
     
-    def test_signup_duplicate_participant(self):
+    def test_signup_duplicate_participant(self, client):
         """Test signup when student is already registered"""
-        response = self.client.post(
+        response = client.post(
             "/activities/Test Activity/signup?email=existing@mergington.edu"
         )
         assert response.status_code == 400
@@ -101,38 +125,53 @@ class TestActivitySignup:
         data = response.json()
         assert data["detail"] == "Student is already signed up"
     
-    def test_signup_missing_email(self):
+    def test_signup_full_activity(self, client):
+        """Test signup when the activity has reached its capacity"""
+        response = client.post(
+            "/activities/Full Activity/signup?email=newstudent@mergington.edu"
+        )
+        assert response.status_code == 409
+        
+        data = response.json()
+        assert data["detail"] == "Activity is full"
+    
+    def test_signup_missing_email(self, client):
         """Test signup without providing email parameter"""
-        response = self.client.post("/activities/Test Activity/signup")
+        response = client.post("/activities/Test Activity/signup")
+        assert response.status_code == 422  # FastAPI validation error
+    
+    def test_signup_invalid_email(self, client):
+        """Test signup with a malformed email parameter"""
+        response = client.post("/activities/Test Activity/signup?email=not-an-email")
         assert response.status_code == 422  # FastAPI validation error
+    
+    def test_signup_email_without_domain_dot(self, client):
+        """Test signup with an address the form's email input accepts"""
+        response = client.post("/activities/Test Activity/signup?email=student@localhost")
+        assert response.status_code == 200
 
 
 class TestActivityUnregister:
     """Test suite for activity unregistration functionality"""
     
-    def setup_method(self):
-        """Reset activities before each test"""
-        from app import activities
-        activities.clear()
-        activities.update({
-            "Test Activity": {
-                "description": "A test activity",
-                "schedule": "Test schedule",
-                "max_participants": 3,
-                "participants": ["student1@mergington.edu", "student2@mergington.edu"]
-            },
-            "Empty Activity": {
-                "description": "An empty test activity",
-                "schedule": "Test schedule",
-                "max_participants": 2,
-                "participants": []
-            }
-        })
-        self.client = TestClient(app)
-    
-    def test_unregister_success(self):
+    ACTIVITIES = {
+        "Test Activity": Activity(
+            description="A test activity",
+            schedule="Test schedule",
+            max_participants=3,
+            participants={"student1@mergington.edu", "student2@mergington.edu"}
+        ),
+        "Empty Activity": Activity(
+            description="An empty test activity",
+            schedule="Test schedule",
+            max_participants=2,
+            participants=set()
+        )
+    }
+    
+    def test_unregister_success(self, client):
         """Test successful unregistration from an activity"""
-        response = self.client.delete(
+        response = client.delete(
             "/activities/Test Activity/unregister?email=student1@mergington.edu"
         )
         assert response.status_code == 200
@@ -143,14 +182,14 @@ class TestActivityUnregister:
         assert "Test Activity" in data["message"]
         
         # Verify the participant was removed
-        activities_response = self.client.get("/activities")
+        activities_response = client.get("/activities")
         activities_data = activities_response.json()
         assert "student1@mergington.edu" not in activities_data["Test Activity"]["participants"]
         assert "student2@mergington.edu" in activities_data["Test Activity"]["participants"]
     
-    def test_unregister_nonexistent_activity(self):
+    def test_unregister_nonexistent_activity(self, client):
         """Test unregistration from a non-existent activity"""
-        response = self.client.delete(
+        response = client.delete(
             "/activities/Nonexistent Activity/unregister?email=student@mergington.edu"
         )
         assert response.status_code == 404
@@ -158,9 +197,9 @@ class TestActivityUnregister:
         data = response.json()
         assert data["detail"] == "Activity not found"
     
-    def test_unregister_not_registered(self):
+    def test_unregister_not_registered(self, client):
         """Test unregistration when student is not registered"""
-        response = self.client.delete(
+        response = client.delete(
             "/activities/Empty Activity/unregister?email=notregistered@mergington.edu"
         )
         assert response.status_code == 400
@@ -168,76 +207,168 @@ class TestActivityUnregister:
         data = response.json()
         assert data["detail"] == "Student is not signed up for this activity"
     
-    def test_unregister_missing_email(self):
+    def test_unregister_missing_email(self, client):
         """Test unregistration without providing email parameter"""
-        response = self.client.delete("/activities/Test Activity/unregister")
+        response = client.delete("/activities/Test Activity/unregister")
+        assert response.status_code == 422  # FastAPI validation error
+    
+    def test_unregister_invalid_email(self, client):
+        """Test unregistration with a malformed email parameter"""
+        response = client.delete("/activities/Test Activity/unregister?email=not-an-email")
         assert response.status_code == 422  # FastAPI validation error
 
 
 class TestDataIntegrity:
     """Test suite for data consistency and edge cases"""
     
-    def setup_method(self):
-        """Reset activities before each test"""
-        from app import activities
-        activities.clear()
-        activities.update({
-            "Math Club": {
-                "description": "Mathematics activities",
-                "schedule": "Mondays 3-4 PM",
-                "max_participants": 2,
-                "participants": ["alice@mergington.edu"]
-            }
-        })
-        self.client = TestClient(app)
-    
-    def test_activity_capacity_enforcement(self):
+    ACTIVITIES = {
+        "Math Club": Activity(
+            description="Mathematics activities",
+            schedule="Mondays 3-4 PM",
+            max_participants=2,
+            participants={"alice@mergington.edu"}
+        )
+    }
+    
+    def test_activity_capacity_enforcement(self, client):
         """Test that activities don't exceed their maximum capacity"""
         # Fill the activity to capacity
-        response1 = self.client.post(
+        response1 = client.post(
             "/activities/Math Club/signup?email=bob@mergington.edu"
         )
         assert response1.status_code == 200
         
         # Verify activity is at capacity
-        activities_response = self.client.get("/activities")
+        activities_response = client.get("/activities")
         activities_data = activities_response.json()
         math_club = activities_data["Math Club"]
         assert len(math_club["participants"]) == math_club["max_participants"]
+        
+        # Further signups are rejected
+        response2 = client.post(
+            "/activities/Math Club/signup?email=carol@mergington.edu"
+        )
+        assert response2.status_code == 409
+        assert response2.json()["detail"] == "Activity is full"
+        
+        activities_response = client.get("/activities")
+        assert "carol@mergington.edu" not in activities_response.json()["Math Club"]["participants"]
     
-    def test_signup_and_unregister_workflow(self):
+    def test_concurrent_signups_respect_capacity(self, store):
+        """Test that concurrent signups cannot push an activity past capacity"""
+        async def sign_up_all():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                return await asyncio.gather(*(
+                    ac.post(f"/activities/Math Club/signup?email=student{i}@mergington.edu")
+                    for i in range(10)
+                ))
+        
+        responses = asyncio.run(sign_up_all())
+        
+        # Only one seat was left next to alice
+        assert sorted(r.status_code for r in responses) == [200] + [409] * 9
+        assert len(store.activities["Math Club"].participants) == 2
+    
+    def test_signup_and_unregister_workflow(self, client):
         """Test complete workflow: signup then unregister"""
         email = "workflow@mergington.edu"
         activity = "Math Club"
         
         # Sign up
-        signup_response = self.client.post(f"/activities/{activity}/signup?email={email}")
+        signup_response = client.post(f"/activities/{activity}/signup?email={email}")
         assert signup_response.status_code == 200
         
         # Verify signup
-        activities_response = self.client.get("/activities")
+        activities_response = client.get("/activities")
         activities_data = activities_response.json()
         assert email in activities_data[activity]["participants"]
         
         # Unregister
-        unregister_response = self.client.delete(f"/activities/{activity}/unregister?email={email}")
+        unregister_response = client.delete(f"/activities/{activity}/unregister?email={email}")
         assert unregister_response.status_code == 200
         
         # Verify unregistration
-        activities_response = self.client.get("/activities")
+        activities_response = client.get("/activities")
         activities_data = activities_response.json()
         assert email not in activities_data[activity]["participants"]
     
-    def test_special_characters_in_email(self):
+    def test_special_characters_in_email(self, client):
         """Test handling of special characters in email addresses"""
         special_email = "test.email-tag@mergington.edu"
         
-        response = self.client.post(
+        response = client.post(
             f"/activities/Math Club/signup?email={special_email}"
         )
         assert response.status_code == 200
         
         # Verify the participant was added correctly
-        activities_response = self.client.get("/activities")
+        activities_response = client.get("/activities")
         activities_data = activities_response.json()
-        assert special_email in activities_data["Math Club"]["participants"]
\ No newline at end of file
+        assert special_email in activities_data["Math Club"]["participants"]
+    
+    def test_activities_cache_refreshes_after_signup(self, client):
+        """Test that a cached activities payload is refreshed after a mutation"""
+        email = "cached@mergington.edu"
+        
+        # Prime the cached payload
+        before = client.get("/activities").json()
+        assert email not in before["Math Club"]["participants"]
+        
+        signup_response = client.post(f"/activities/Math Club/signup?email={email}")
+        assert signup_response.status_code == 200
+        
+        after = client.get("/activities").json()
+        assert email in after["Math Club"]["participants"]
+    
+    def test_activities_etag_changes_after_signup(self, client):
+        """Test that a mutation invalidates the previously issued ETag"""
+        etag = client.get("/activities").headers["etag"]
+        
+        client.post("/activities/Math Club/signup?email=etag@mergington.edu")
+        
+        response = client.get("/activities", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert "etag@mergington.edu" in response.json()["Math Club"]["participants"]
+    
+    def test_participant_index_tracks_signups(self, client, store):
+        """Test that the reverse participant index follows signup and unregister"""
+        email = "indexed@mergington.edu"
+        
+        client.post(f"/activities/Math Club/signup?email={email}")
+        assert store.participant_index[email] == {"Math Club"}
+        
+        client.delete(f"/activities/Math Club/unregister?email={email}")
+        assert email not in store.participant_index
+    
+    def test_message_escapes_quotes_in_email(self, client):
+        """Test that confirmation messages stay valid JSON for quoted emails"""
+        quoted_email = 'quote"d@mergington.edu'
+        
+        response = client.post(
+            "/activities/Math Club/signup", params={"email": quoted_email}
+        )
+        assert response.status_code == 200
+        assert response.json()["message"] == f"Signed up {quoted_email} for Math Club"
+
+
+class TestActivityStore:
+    """Test suite for the activity store itself"""
+    
+    def test_store_does_not_mutate_source_activities(self):
+        """Test that building a store leaves the caller's activities untouched"""
+        source = {
+            "Math Club": Activity(
+                description="Mathematics activities",
+                schedule="Mondays 3-4 PM",
+                max_participants=2,
+                participants={"alice@mergington.edu"}
+            )
+        }
+        participants = source["Math Club"].participants
+        
+        ActivityStore(source).activities["Math Club"].participants.add("new@mergington.edu")
+        
+        assert source["Math Club"].participants is participants
+        assert participants == {"alice@mergington.edu"}